@@ -87,7 +87,12 @@ static int run_all_tests(void) {
     }
 }
 
-int main(int argc __attribute__((unused)), char *argv[] __attribute__((unused))) {
+/**
+ * Run the simulator: initialize the interface layer, run all tests and
+ * clean up. Exported so the simulator can also be loaded as a shared
+ * library (bin/libicd3_simulator.so) and run inside the model's process.
+ */
+int icd3_simulator_run(void) {
     LOG_INFO("NewICD3 Universal IC Simulator");
     LOG_INFO("==============================");
     
@@ -105,6 +110,11 @@ int main(int argc __attribute__((unused)), char *argv[] __attribute__((unused)))
     interface_layer_deinit();
     
     LOG_INFO("System shutdown complete.");
+    fflush(stdout);
     
     return (result == 0) ? EXIT_SUCCESS : EXIT_FAILURE;
-}
\ No newline at end of file
+}
+
+int main(int argc __attribute__((unused)), char *argv[] __attribute__((unused))) {
+    return icd3_simulator_run();
+}
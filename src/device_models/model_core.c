@@ -0,0 +1,80 @@
+/**
+ * @file model_core.c
+ * @brief Native fast path for the Python device model server
+ *
+ * Built as a shared library and loaded by model_interface.py via ctypes.
+ * model_core_handle_message() receives one protocol_message_t from a client
+ * socket and, for register reads and writes inside the model's dense
+ * register window, answers it directly against the model's register array.
+ * Every other message is handed back to Python unprocessed.
+ */
+
+#include "interface_layer.h"
+#include <string.h>
+#include <errno.h>
+#include <sys/socket.h>
+
+/* Return codes besides the received length (see model_core_handle_message) */
+#define MODEL_CORE_ERROR    (-1)
+#define MODEL_CORE_HANDLED  (-2)
+
+/**
+ * Receive and, if possible, serve one message from a model client.
+ *
+ * @param fd        Connected SOCK_SEQPACKET client socket
+ * @param frame     Buffer of sizeof(protocol_message_t) bytes for the request
+ * @param regs      Dense register array shared with the Python model
+ * @param reg_base  Bus address of regs[0]
+ * @param reg_count Number of 32-bit registers in regs
+ *
+ * @return MODEL_CORE_HANDLED if a READ/WRITE was answered here,
+ *         the received length if the frame is left in @p frame for Python,
+ *         0 if the peer closed the connection, MODEL_CORE_ERROR on failure.
+ */
+int model_core_handle_message(int fd, uint8_t *frame, uint32_t *regs,
+                              uint32_t reg_base, uint32_t reg_count) {
+    /* Retry on EINTR like Python's own socket calls (PEP 475) */
+    ssize_t received;
+    do {
+        received = recv(fd, frame, sizeof(protocol_message_t), 0);
+    } while (received < 0 && errno == EINTR);
+    if (received < 0) {
+        return MODEL_CORE_ERROR;
+    }
+    if (received != sizeof(protocol_message_t)) {
+        return (int)received;
+    }
+
+    protocol_message_t request;
+    memcpy(&request, frame, sizeof(request));
+
+    uint32_t offset = request.address - reg_base;
+    uint32_t index = offset >> 2;
+    if ((request.command != CMD_READ && request.command != CMD_WRITE) ||
+        request.address < reg_base || (offset & 3) || index >= reg_count) {
+        return (int)received;
+    }
+
+    protocol_message_t response;
+    memset(&response, 0, sizeof(response));
+    response.device_id = request.device_id;
+    response.command = request.command;
+    response.address = request.address;
+    response.length = request.length;
+    response.result = RESULT_SUCCESS;
+
+    if (request.command == CMD_READ) {
+        memcpy(response.data, &regs[index], sizeof(uint32_t));
+    } else {
+        memcpy(&regs[index], request.data, sizeof(uint32_t));
+    }
+
+    ssize_t sent;
+    do {
+        sent = send(fd, &response, sizeof(response), MSG_NOSIGNAL);
+    } while (sent < 0 && errno == EINTR);
+    if (sent != sizeof(response)) {
+        return MODEL_CORE_ERROR;
+    }
+    return MODEL_CORE_HANDLED;
+}
@@ -32,6 +32,10 @@ Usage:
 @date 2024
 """
 
+import array
+import collections
+import ctypes
+import selectors
 import socket
 import struct
 import threading
@@ -40,6 +44,7 @@ import os
 import sys
 import logging
 import signal
+from multiprocessing import resource_tracker, shared_memory
 
 # Setup logging for Python model interface
 def setup_logging():
@@ -80,82 +85,327 @@ RESULT_ERROR = 0x01
 RESULT_TIMEOUT = 0x02
 RESULT_INVALID_ADDR = 0x03
 
-SOCKET_PATH = "/tmp/icd3_interface"
+# protocol_message_t layout: device_id, command, address, length, result + data[256]
+_HDR = struct.Struct('<IIIII')
+DATA_SIZE = 256
+MESSAGE_SIZE = _HDR.size + DATA_SIZE
+# Whole response frame: header, first data word, zero padding for the rest
+_RESP = struct.Struct('<IIIII I 252x')
+_U32 = struct.Struct('<I')  # One register value in the data array
+
+# Dense register window backing the device at DEVICE_BASE_ADDR
+REG_BASE = 0x40000000
+REG_COUNT = 4096  # 32-bit registers in the window
+REG_DEFAULT = 0xDEADBEEF  # Value read back from never-written registers
+
+# Optional POSIX shared memory copy of the register window, mapped by the C
+# driver so in-window register accesses need no message at all. Must match
+# SHARED_REGS_NAME in driver_interface.c
+SHARED_REGS_NAME = "icd3_regs_{}"
+_SHM_HDR = struct.Struct('<IIII')  # live flag, REG_BASE, REG_COUNT, reserved
+
+# Optional native fast path for in-window register reads/writes, built by
+# `make` from model_core.c; the pure Python path is used when it is missing
+MODEL_CORE_PATH = os.getenv('ICD3_MODEL_CORE', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bin', 'libmodel_core.so'))
+MODEL_CORE_HANDLED = -2  # Message was answered natively
+
+def load_model_core():
+    """Load model_core_handle_message from the native library, or return None"""
+    try:
+        lib = ctypes.CDLL(MODEL_CORE_PATH, use_errno=True)
+    except OSError as e:
+        logger.debug("Native model core not available: %s", e)
+        return None
+    handle_message = lib.model_core_handle_message
+    handle_message.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p,
+                               ctypes.c_uint32, ctypes.c_uint32]
+    handle_message.restype = ctypes.c_int
+    return handle_message
+
+_model_core = load_model_core()
+
+# On Linux the model listens in the abstract socket namespace (leading NUL):
+# there is no socket file to unlink and no stale file to trip over on restart
+if sys.platform.startswith('linux'):
+    SOCKET_PATH = "\0icd3_interface"
+else:
+    SOCKET_PATH = "/tmp/icd3_interface"
+ABSTRACT_SOCKET = SOCKET_PATH.startswith("\0")
+SOCKET_NAME = SOCKET_PATH.replace("\0", "@", 1)  # Printable form for logs
+UNIX_SOCK_BUF = 262144  # SO_SNDBUF/SO_RCVBUF for model sockets
 DRIVER_PID_FILE = "/tmp/icd3_driver_pid"
+IRQ_FILE_LINGER = 0.5  # Seconds an interrupt file is kept for the driver to read
 
 class ModelInterface:
-    def __init__(self, device_id=1):
+    def __init__(self, device_id=1, shared_registers=False):
         self.device_id = device_id
-        self.registers = {}  # Simple register storage
+        self.registers = {}  # Register storage for addresses outside the dense window
+        self._regs = array.array('I', [REG_DEFAULT]) * REG_COUNT  # Aligned registers from REG_BASE
+        self._shared_registers = shared_registers  # Publish _regs in shared memory while serving
+        self._shm = None  # Shared memory publishing the register window, while published
         self.running = False
         self.socket = None
-        self.client_sockets = []  # Track connected clients for interrupt delivery
+        self.clients = {}  # Connected client sockets keyed by fileno
+        self._clients_lock = threading.Lock()  # Guards clients against stop() from other threads
         self.driver_pid = None  # PID of the C driver process for signal-based interrupts
+        self._resp_buf = bytearray(MESSAGE_SIZE)  # Reused response buffer
+        self._resp_view = memoryview(self._resp_buf)  # Zero-copy view handed to send()
+        self._req_buf = bytearray(MESSAGE_SIZE)  # Reused receive buffer for every request
+        self._req_view = memoryview(self._req_buf)
+        # Raw addresses handed to the native core; neither buffer is ever resized
+        self._req_ptr = ctypes.addressof((ctypes.c_char * MESSAGE_SIZE).from_buffer(self._req_buf))
+        self._regs_ptr = ctypes.addressof(ctypes.c_char.from_buffer(self._regs))
+        self._selector = None  # Event loop selector, set while start() is running
+        self._wakeup_w = None  # Socket used to wake the event loop from other threads
+        self._irq_cleanup = None  # (interrupt file, monotonic deadline) awaiting unlink
+        self._pending_irqs = collections.deque()  # Interrupts waiting for the event loop
+        # Command handlers indexed by command code (CMD_INTERRUPT is model -> driver only)
+        self._dispatch = [None, self._do_read, self._do_write, None, self._do_init, self._do_deinit]
+        self._use_core = False  # Let the native core answer register accesses, set by start()
         
     def start(self):
         """Start the device model server"""
         self.running = True
+        self._pin_to_cpu()
         
-        # Remove existing socket
-        try:
-            os.unlink(SOCKET_PATH)
-            logger.info(f"Removed existing socket: {SOCKET_PATH}")
-        except OSError:
-            logger.info(f"No existing socket to remove: {SOCKET_PATH}")
+        # Remove existing socket file (abstract sockets have none)
+        if not ABSTRACT_SOCKET:
+            try:
+                os.unlink(SOCKET_PATH)
+                logger.info("Removed existing socket: %s", SOCKET_PATH)
+            except OSError:
+                logger.info("No existing socket to remove: %s", SOCKET_PATH)
             
         # Create and bind socket
         try:
-            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            self._configure_socket(self.socket)
             self.socket.bind(SOCKET_PATH)
             self.socket.listen(5)
-            logger.info(f"Device model {self.device_id} started on {SOCKET_PATH}")
-            logger.debug(f"Socket file exists: {os.path.exists(SOCKET_PATH)}")
+            logger.info("Device model %d started on %s", self.device_id, SOCKET_NAME)
         except Exception as e:
             logger.error(f"Failed to create socket: {e}")
             return
         
-        while self.running:
-            try:
-                logger.debug("Waiting for client connection...")
-                client, addr = self.socket.accept()
-                logger.info(f"Client connected")
-                self.client_sockets.append(client)
-                # Handle client in separate thread
-                threading.Thread(target=self.handle_client, args=(client,)).start()
-            except OSError as e:
-                if self.running:  # Only print error if we're still supposed to be running
-                    logger.error(f"Socket error: {e}")
-                break
+        # Holding the model socket proves no other model is serving, so a
+        # register segment left behind for this device can be retired now
+        try:
+            self._retire_shared_registers(SHARED_REGS_NAME.format(self.device_id))
+            if self._shared_registers:
+                self._open_shared_registers()
+        except OSError as e:
+            logger.warning(f"Serving registers without shared memory: {e}")
+        self._use_core = self._native_core_usable()
+        
+        # Single-threaded event loop: the listener, every client and the
+        # wakeup socket used by stop() and trigger_interrupt_to_driver()
+        # are multiplexed on one selector
+        self.socket.setblocking(False)
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_r.setblocking(False)
+        wakeup_w.setblocking(False)
+        self._wakeup_w = wakeup_w
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.socket, selectors.EVENT_READ, self._accept)
+        self._selector.register(wakeup_r, selectors.EVENT_READ, None)
+        
+        try:
+            while self.running:
+                # Wake up in time to remove the last interrupt file
+                timeout = None
+                if self._irq_cleanup is not None:
+                    timeout = max(0.0, self._irq_cleanup[1] - time.monotonic())
+                for key, _ in self._selector.select(timeout):
+                    if key.data is None:
+                        # Woken by stop() or by queued interrupts
+                        wakeup_r.recv(512)
+                        self.flush_interrupts()
+                    else:
+                        key.data(key.fileobj)
+                self._expire_interrupt_file()
+        except OSError as e:
+            if self.running:  # Only print error if we're still supposed to be running
+                logger.error(f"Socket error: {e}")
+        finally:
+            self._wakeup_w = None
+            self._selector.close()
+            self._selector = None
+            wakeup_r.close()
+            wakeup_w.close()
+            self.flush_interrupts()
+            # Hand a pending interrupt file cleanup over to a timer
+            cleanup, self._irq_cleanup = self._irq_cleanup, None
+            if cleanup is not None:
+                self._unlink_later(cleanup[0], cleanup[1] - time.monotonic())
+            self._close_shared_registers()
+            
+    def _accept(self, server_socket):
+        """Accept a pending connection and register it with the event loop"""
+        try:
+            client, addr = server_socket.accept()
+        except BlockingIOError:
+            return
+        logger.debug("Client connected")
+        self._configure_socket(client)
+        with self._clients_lock:
+            if not self.running:
+                client.close()
+                return
+            self.clients[client.fileno()] = client
+        self._selector.register(client, selectors.EVENT_READ, self.handle_client)
+        
+    def _native_core_usable(self):
+        """Whether the native core may answer register accesses for this model
+        
+        The core never calls process_command() or the READ/WRITE handlers,
+        so it is only used while none of them is overridden or replaced.
+        """
+        if _model_core is None:
+            return False
+        for name in ('process_command', '_do_read', '_do_write'):
+            if getattr(type(self), name) is not getattr(ModelInterface, name) or name in vars(self):
+                return False
+        return (self._dispatch[CMD_READ] == self._do_read and
+                self._dispatch[CMD_WRITE] == self._do_write)
+        
+    @staticmethod
+    def _pin_to_cpu():
+        """Pin the calling (event loop) thread to the CPU named by ICD3_MODEL_CPU"""
+        cpu = os.getenv('ICD3_MODEL_CPU')
+        if cpu is None or not hasattr(os, 'sched_setaffinity'):
+            return
+        try:
+            os.sched_setaffinity(0, {int(cpu)})
+            logger.info("Event loop pinned to CPU %s", cpu)
+        except (ValueError, OSError) as e:
+            logger.warning(f"Failed to pin event loop to CPU {cpu}: {e}")
+        
+    @staticmethod
+    def _configure_socket(sock):
+        """Apply buffer sizes and latency options to a model socket
+        
+        Every response is written with a single send() on the raw socket;
+        nothing here may be wrapped in makefile()-style buffered I/O, or
+        small replies would sit in a userspace buffer. Should the protocol
+        ever run over TCP, Nagle is disabled for the same reason.
+        """
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, UNIX_SOCK_BUF)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UNIX_SOCK_BUF)
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        
     def stop(self):
         """Stop the device model server"""
         self.running = False
         
+        # Wake the event loop so it notices running is False
+        wakeup = self._wakeup_w
+        if wakeup is not None:
+            try:
+                wakeup.send(b'\x00')
+            except OSError:
+                pass
+        
         # Close all client connections
-        for client in self.client_sockets:
+        with self._clients_lock:
+            clients = list(self.clients.values())
+            self.clients.clear()
+        for client in clients:
             try:
                 client.close()
             except:
                 pass
-        self.client_sockets.clear()
         
         if self.socket:
             self.socket.close()
+        if not ABSTRACT_SOCKET:
+            try:
+                os.unlink(SOCKET_PATH)
+            except OSError:
+                pass
+        
+        # A running event loop still uses the registers; it unpublishes them on exit
+        if self._selector is None:
+            self._close_shared_registers()
+            
+    def _open_shared_registers(self):
+        """Move the register window into POSIX shared memory for the C driver"""
+        name = SHARED_REGS_NAME.format(self.device_id)
+        size = _SHM_HDR.size + REG_COUNT * 4
         try:
-            os.unlink(SOCKET_PATH)
-        except OSError:
-            pass
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._retire_shared_registers(name)
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        # Unpublishing is up to the model, which clears the live flag first;
+        # keep multiprocessing's resource tracker from unlinking the segment
+        # behind a driver's back when the model dies
+        resource_tracker.unregister(shm._name, "shared_memory")
+        self._shm = shm
+        regs = shm.buf[_SHM_HDR.size:size].cast('I')
+        regs[:] = self._regs
+        self._regs = regs
+        self._regs_ptr = ctypes.addressof(ctypes.c_char.from_buffer(regs))
+        _SHM_HDR.pack_into(shm.buf, 0, 1, REG_BASE, REG_COUNT, 0)
+        logger.info("Sharing %d registers at 0x%x via /%s", REG_COUNT, REG_BASE, name)
+        
+    @staticmethod
+    def _retire_shared_registers(name):
+        """Unpublish a segment left behind by a model that did not shut down cleanly"""
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return
+        # Clear the live flag first: drivers still mapping the segment would
+        # otherwise keep reading and writing orphaned memory
+        if stale.size >= _SHM_HDR.size:
+            _U32.pack_into(stale.buf, 0, 0)
+        stale.close()
+        ModelInterface._unlink_segment(stale)
+        
+    @staticmethod
+    def _unlink_segment(shm):
+        """Unlink a segment that someone else may already have unlinked"""
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        
+    def _close_shared_registers(self):
+        """Unpublish the shared register window, keeping its contents privately"""
+        shm, self._shm = self._shm, None
+        if shm is None:
+            return
+        # Clearing the live flag makes drivers drop their mapping
+        _SHM_HDR.pack_into(shm.buf, 0, 0, REG_BASE, REG_COUNT, 0)
+        regs = array.array('I', self._regs)
+        self._regs.release()
+        self._regs = regs
+        self._regs_ptr = ctypes.addressof(ctypes.c_char.from_buffer(regs))
+        shm.close()
+        resource_tracker.register(shm._name, "shared_memory")  # unlink() unregisters it
+        self._unlink_segment(shm)
             
-    def get_driver_pid(self):
-        """Get the PID of the C driver process for signal-based interrupts"""
+    def _read_driver_pid_file(self):
+        """Return the PID the C driver published in DRIVER_PID_FILE, or None"""
         try:
-            if os.path.exists(DRIVER_PID_FILE):
-                with open(DRIVER_PID_FILE, 'r') as f:
-                    pid = int(f.read().strip())
-                    self.driver_pid = pid
-                    logger.debug(f"Found driver PID: {pid}")
-                    return pid
+            with open(DRIVER_PID_FILE, 'r') as f:
+                pid = int(f.read().strip())
+        except FileNotFoundError:
+            return None
         except (ValueError, IOError) as e:
             logger.warning(f"Failed to read driver PID file: {e}")
+            return None
+        self.driver_pid = pid
+        logger.debug("Found driver PID: %d", pid)
+        return pid
+        
+    def get_driver_pid(self):
+        """Get the PID of the C driver process for signal-based interrupts"""
+        pid = self._read_driver_pid_file()
+        if pid:
+            return pid
         
         # Fallback: try to find the process by name (less reliable)
         try:
@@ -165,7 +415,7 @@ class ModelInterface:
             if result.returncode == 0 and result.stdout.strip():
                 pid = int(result.stdout.strip().split()[0])
                 self.driver_pid = pid
-                logger.debug(f"Found driver PID via pgrep: {pid}")
+                logger.debug("Found driver PID via pgrep: %d", pid)
                 return pid
         except Exception as e:
             logger.warning(f"Failed to find driver process: {e}")
@@ -173,127 +423,232 @@ class ModelInterface:
         return None
             
     def trigger_interrupt_to_driver(self, interrupt_id):
-        """Trigger an interrupt to the driver interface using signals"""
-        logger.info(f"Model triggering interrupt {interrupt_id} to driver for device {self.device_id}")
+        """Trigger an interrupt to the driver interface using signals
         
-        # Get the driver process PID
-        driver_pid = self.get_driver_pid()
-        if not driver_pid:
-            logger.error("Cannot send interrupt: driver PID not found")
+        Interrupts are queued and delivered by the event loop thread, which
+        flushes everything queued since it last woke with one interrupt file
+        and one SIGUSR1. Without a running loop they are delivered directly.
+        """
+        logger.info("Model triggering interrupt %s to driver for device %d",
+                    interrupt_id, self.device_id)
+        
+        self._pending_irqs.append(interrupt_id)
+        wakeup = self._wakeup_w
+        if wakeup is not None:
+            try:
+                wakeup.send(b'\x01')
+                return
+            except BlockingIOError:
+                return  # Loop already has a wakeup pending
+            except OSError:
+                pass  # Loop is shutting down
+        self.flush_interrupts()
+        
+    def flush_interrupts(self):
+        """Deliver all queued interrupts with one interrupt file and one SIGUSR1"""
+        pending = []
+        try:
+            while True:
+                pending.append(self._pending_irqs.popleft())
+        except IndexError:
+            pass
+        if not pending:
             return
         
+        # The driver rewrites its PID file whenever it starts, so re-read it
+        # on every flush rather than trusting a cached PID that may belong to
+        # a restarted driver or, once reused, to an unrelated process. Only
+        # the pgrep fallback without a PID file forks
+        driver_pid = self.get_driver_pid()
+        for attempt in range(2):
+            if not driver_pid:
+                logger.error("Cannot send interrupt: driver PID not found")
+                return
+            if self._signal_driver(driver_pid, pending):
+                return
+            # The driver went away between reading its PID and signalling it;
+            # retry once if a new driver has published its PID meanwhile
+            stale_pid, driver_pid = driver_pid, self.get_driver_pid()
+            if driver_pid == stale_pid:
+                break
+        logger.error(f"Dropping {len(pending)} interrupt(s): driver process not found")
+        
+    def _signal_driver(self, driver_pid, pending):
+        """Write the interrupt file for driver_pid and send it SIGUSR1
+        
+        Returns False if the driver process no longer exists, True otherwise.
+        """
+        # Since Python doesn't directly support sigqueue, we send SIGUSR1
+        # and write interrupt details to a temporary file, one
+        # "device_id,interrupt_id" line per queued interrupt
+        interrupt_file = f"/tmp/icd3_interrupt_{driver_pid}"
         try:
-            # Pack device_id (lower 16 bits) and interrupt_id (upper 16 bits) into signal value
-            signal_data = (interrupt_id << 16) | (self.device_id & 0xFFFF)
+            with open(interrupt_file, 'w') as f:
+                f.write("".join([f"{self.device_id},{irq}\n" for irq in pending]))
             
-            # Send SIGUSR1 with data using sigqueue (if available) or kill
+            # Send SIGUSR1 signal
+            os.kill(driver_pid, signal.SIGUSR1)
+            logger.debug("Sent SIGUSR1 to PID %d for device %d, %d interrupt(s)",
+                         driver_pid, self.device_id, len(pending))
+        except PermissionError:
+            logger.error(f"Permission denied when sending signal to PID {driver_pid}")
+            return True
+        except ProcessLookupError:
+            logger.error(f"Process {driver_pid} not found")
+            self.driver_pid = None
             try:
-                # Try to use os.kill with signal data (Python 3.3+ on some systems)
-                # Since Python doesn't directly support sigqueue, we'll use a simpler approach
-                # We'll send SIGUSR1 and write interrupt details to a temporary file
-                
-                # Create a temporary file with interrupt details
-                import tempfile
-                interrupt_file = f"/tmp/icd3_interrupt_{driver_pid}"
-                with open(interrupt_file, 'w') as f:
-                    f.write(f"{self.device_id},{interrupt_id}")
-                
-                # Send SIGUSR1 signal
-                os.kill(driver_pid, signal.SIGUSR1)
-                logger.debug(f"Sent SIGUSR1 to PID {driver_pid} for device {self.device_id}, interrupt {interrupt_id}")
-                
-                # Clean up the temporary file after a short delay
-                def cleanup_file():
-                    time.sleep(0.5)  # Give the C process time to read it
-                    try:
-                        os.unlink(interrupt_file)
-                    except:
-                        pass
-                
-                threading.Thread(target=cleanup_file, daemon=True).start()
-                
-            except PermissionError:
-                logger.error(f"Permission denied when sending signal to PID {driver_pid}")
-            except ProcessLookupError:
-                logger.error(f"Process {driver_pid} not found")
-            except Exception as e:
-                logger.error(f"Failed to send signal: {e}")
-                
+                os.unlink(interrupt_file)
+            except OSError:
+                pass
+            return False
         except Exception as e:
-            logger.error(f"Failed to trigger interrupt via signal: {e}")
+            logger.error(f"Failed to send signal: {e}")
+            return True
+        
+        # Clean up the temporary file after a short delay, giving the
+        # C process time to read it. The event loop does this itself; a
+        # later flush to the same driver rewrites the file and postpones it
+        if self._selector is not None:
+            previous = self._irq_cleanup
+            if previous is not None and previous[0] != interrupt_file:
+                # The driver PID changed; the old file still needs removing
+                self._unlink_later(previous[0], previous[1] - time.monotonic())
+            self._irq_cleanup = (interrupt_file, time.monotonic() + IRQ_FILE_LINGER)
+        else:
+            self._unlink_later(interrupt_file, IRQ_FILE_LINGER)
+        return True
                     
-    def handle_client(self, client_socket):
-        """Handle communication with a client - one message per connection"""
+    def _expire_interrupt_file(self):
+        """Remove the last interrupt file once its deadline has passed"""
+        cleanup = self._irq_cleanup
+        if cleanup is None or time.monotonic() < cleanup[1]:
+            return
+        self._irq_cleanup = None
         try:
-            # Receive full protocol message (5 uint32_t + 256 bytes data = 276 bytes total)
-            expected_size = 5 * 4 + 256  # 5 uint32_t fields + 256 byte data array
+            os.unlink(cleanup[0])
+        except OSError:
+            pass
             
-            data = client_socket.recv(expected_size)
-            if not data:
-                return
+    @staticmethod
+    def _unlink_later(path, delay):
+        """Remove path after delay seconds without an event loop to do it"""
+        def unlink():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        # Not a daemon: a model exiting right after an interrupt still
+        # removes the file, at the cost of waiting out the delay
+        threading.Timer(max(0.0, delay), unlink).start()
             
-            if len(data) < expected_size:
-                # Try to receive remaining data
-                remaining = expected_size - len(data)
-                more_data = client_socket.recv(remaining)
-                if more_data:
-                    data += more_data
+    def handle_client(self, client_socket):
+        """Handle one message from a client
+        
+        Connections are persistent: the client stays registered with the
+        event loop until it closes the connection or an error occurs.
+        """
+        try:
+            # Receive full protocol message (5 uint32_t + 256 bytes data = 276 bytes total)
+            # SOCK_SEQPACKET preserves message boundaries, so one recv is one message
+            if self._use_core and not logger.isEnabledFor(logging.DEBUG):
+                # In-window READ/WRITE are answered natively; anything else
+                # is left in the request buffer for the Python path below
+                received = _model_core(client_socket.fileno(), self._req_ptr,
+                                       self._regs_ptr, REG_BASE, REG_COUNT)
+                if received == MODEL_CORE_HANDLED:
+                    return
+                if received == 0:
+                    self._close_client(client_socket)
+                    return
+                if received < 0:
+                    err = ctypes.get_errno()
+                    raise OSError(err, os.strerror(err))
+                data = self._req_view[:received]
+            else:
+                received = client_socket.recv_into(self._req_buf)
+                if not received:
+                    self._close_client(client_socket)
+                    return
+                data = self._req_view[:received]
                 
             # Parse message according to C protocol_message_t structure
-            if len(data) >= expected_size:
+            if len(data) == MESSAGE_SIZE:
                 # Unpack: device_id, command, address, length, result
-                device_id, command, address, length, result = struct.unpack('<IIIII', data[:20])
-                message_data = data[20:20+256]  # Extract the 256-byte data array
+                device_id, command, address, length, result = _HDR.unpack_from(data, 0)
+                message_data = data[_HDR.size:MESSAGE_SIZE]  # Extract the 256-byte data array
                 
-                logger.debug(f"Received: device_id={device_id}, cmd={command}, addr=0x{address:x}, len={length}")
+                logger.debug("Received: device_id=%d, cmd=%d, addr=0x%x, len=%d",
+                             device_id, command, address, length)
                 
                 response = self.process_command(device_id, command, address, length, message_data)
                 client_socket.send(response)
+            else:
+                logger.warning(f"Dropping malformed message ({len(data)}/{MESSAGE_SIZE} bytes)")
                 
         except Exception as e:
             logger.error(f"Error handling client: {e}")
-        finally:
-            # Always close the client connection after handling one message
-            if client_socket in self.client_sockets:
-                self.client_sockets.remove(client_socket)
-            client_socket.close()
-            
-    def process_command(self, device_id, command, address, length, data):
-        """Process a command and return response"""
-        result = RESULT_SUCCESS
-        response_data = b'\x00' * 256  # Initialize response data
-        
-        if command == CMD_READ:
-            # Read from register
-            value = self.registers.get(address, 0xDEADBEEF)  # Default value
-            response_data = struct.pack('<I', value) + b'\x00' * 252
-            logger.debug(f"Read 0x{address:x} = 0x{value:x}")
+            self._close_client(client_socket)
             
-        elif command == CMD_WRITE:
-            # Write to register
-            if len(data) >= 4:
-                value = struct.unpack('<I', data[:4])[0]
-                self.registers[address] = value
-                logger.debug(f"Write 0x{address:x} = 0x{value:x}")
-            else:
-                result = RESULT_ERROR
-                
-        elif command == CMD_INIT:
-            logger.info(f"Device {device_id} initialized")
-            
-        elif command == CMD_DEINIT:
-            logger.info(f"Device {device_id} deinitialized")
+    def _close_client(self, client_socket):
+        """Unregister a client from the event loop and close its connection"""
+        logger.debug("Client disconnected")
+        if self._selector is not None:
+            try:
+                self._selector.unregister(client_socket)
+            except (KeyError, ValueError):
+                pass
+        with self._clients_lock:
+            self.clients.pop(client_socket.fileno(), None)
+        client_socket.close()
             
+    def process_command(self, device_id, command, address, length, data):
+        """Process a command and return a view of the response message"""
+        dispatch = self._dispatch
+        if 0 < command < len(dispatch) and dispatch[command] is not None:
+            result, read_value = dispatch[command](device_id, address, data)
         else:
-            result = RESULT_ERROR
+            result, read_value = RESULT_ERROR, 0
             logger.error(f"Unknown command: {command}")
             
         # Build response message with correct protocol_message_t structure
-        # device_id, command, address, length, result + data[256]
-        response = struct.pack('<IIIII', device_id, command, address, length, result)
-        response += response_data
+        # device_id, command, address, length, result + data[256], in one pack
+        _RESP.pack_into(self._resp_buf, 0, device_id, command, address, length, result, read_value)
+        
+        # The view is only valid until the next call; copy it to keep it
+        return self._resp_view
+
+    # Command handlers: each returns (result, first data word of the response)
+    
+    def _do_read(self, device_id, address, data):
+        """Read from register"""
+        index = (address - REG_BASE) >> 2
+        if 0 <= index < REG_COUNT and not address & 3:
+            value = self._regs[index]
+        else:
+            value = self.registers.get(address, REG_DEFAULT)
+        logger.debug("Read 0x%x = 0x%x", address, value)
+        return RESULT_SUCCESS, value
+        
+    def _do_write(self, device_id, address, data):
+        """Write to register"""
+        if len(data) < 4:
+            return RESULT_ERROR, 0
+        value = _U32.unpack_from(data, 0)[0]
+        index = (address - REG_BASE) >> 2
+        if 0 <= index < REG_COUNT and not address & 3:
+            self._regs[index] = value
+        else:
+            self.registers[address] = value
+        logger.debug("Write 0x%x = 0x%x", address, value)
+        return RESULT_SUCCESS, 0
+        
+    def _do_init(self, device_id, address, data):
+        logger.info("Device %d initialized", device_id)
+        return RESULT_SUCCESS, 0
         
-        return response
+    def _do_deinit(self, device_id, address, data):
+        logger.info("Device %d deinitialized", device_id)
+        return RESULT_SUCCESS, 0
 
 def main():
     """Main function for testing"""
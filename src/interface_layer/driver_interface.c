@@ -12,19 +12,49 @@
 #include <errno.h>
 #include <fcntl.h>
 #include <sys/types.h>
+#include <sys/stat.h>
 #include <ucontext.h>
 
 #define MAX_DEVICES 16
 #define MAX_IRQS 16
 
+/* Model socket; Linux uses the abstract namespace (leading NUL), matching
+ * SOCKET_PATH in model_interface.py */
+#ifdef __linux__
+#define SOCKET_PATH "\0icd3_interface"
+#else
 #define SOCKET_PATH "/tmp/icd3_interface"
+#endif
 #define DRIVER_SOCKET_PATH "/tmp/icd3_driver_interface"
 #define DRIVER_PID_FILE "/tmp/icd3_driver_pid"
 
+/* Shared register window published by models started with
+ * shared_registers=True (see SHARED_REGS_NAME in model_interface.py) */
+#define SHARED_REGS_NAME "/icd3_regs_%u"
+
 /* Global state */
 static device_info_t devices[MAX_DEVICES];
 static int device_count = 0;
 static int server_socket = -1;
+static int model_socket = -1;  /* Persistent connection to the Python model */
+static uint32_t model_generation = 1;  /* Bumped on every new model connection */
+
+/* Header at the start of a shared register segment, followed by the registers */
+typedef struct {
+    uint32_t live;   /* Cleared by the model when it stops */
+    uint32_t base;   /* Bus address of the first register */
+    uint32_t count;  /* Number of 32-bit registers */
+    uint32_t reserved;
+} shared_regs_header_t;
+
+/* Shared register mappings, one per device id that has been looked up */
+static struct {
+    uint32_t device_id;
+    uint32_t generation;  /* model_generation of the last mapping attempt */
+    volatile shared_regs_header_t *header;
+    size_t size;
+} shared_regs[MAX_DEVICES];
+static int shared_regs_count = 0;
 static interrupt_handler_t interrupt_handlers[MAX_IRQS];
 
 /* Signal-based interrupt handling */
@@ -194,15 +224,18 @@ static void interrupt_signal_handler(int sig, siginfo_t *info, void *context) {
     
     FILE *f = fopen(interrupt_file, "r");
     if (f) {
+        /* Models batch interrupts: one "device_id,interrupt_id" line each */
         uint32_t device_id, interrupt_id;
-        if (fscanf(f, "%u,%u", &device_id, &interrupt_id) == 2) {
+        while (fscanf(f, "%u,%u", &device_id, &interrupt_id) == 2) {
             pending_device_interrupt = device_id;
             pending_interrupt_id = interrupt_id;
             interrupt_pending = 1;
             
             printf("Signal interrupt received: device_id=%d, interrupt_id=0x%x\n", 
                    device_id, interrupt_id);
-            interrupt_handlers[interrupt_id](interrupt_id);
+            if (interrupt_id < MAX_IRQS && interrupt_handlers[interrupt_id]) {
+                interrupt_handlers[interrupt_id](interrupt_id);
+            }
         }
         fclose(f);
         /* File will be cleaned up by Python model */
@@ -725,6 +758,18 @@ int interface_layer_deinit(void) {
         unlink(DRIVER_SOCKET_PATH);
     }
     
+    if (model_socket != -1) {
+        close(model_socket);
+        model_socket = -1;
+    }
+    
+    for (int i = 0; i < shared_regs_count; i++) {
+        if (shared_regs[i].header) {
+            munmap((void *)shared_regs[i].header, shared_regs[i].size);
+        }
+    }
+    shared_regs_count = 0;
+    
     /* Clean up PID file */
     unlink(DRIVER_PID_FILE);
 
@@ -837,13 +882,93 @@ int register_interrupt_handler(uint32_t interrupt_id, interrupt_handler_t handle
     return -1;
 }
 
-int send_message_to_model(const protocol_message_t *message, protocol_message_t *response) {
-    printf("Sending to model: device_id=%d, cmd=%d, addr=0x%x, len=%d\n",
-           message->device_id, message->command, message->address, message->length);
+/* Map the shared register segment of a device, or return NULL if the model does not publish one */
+static volatile shared_regs_header_t *map_shared_regs(uint32_t device_id, size_t *size) {
+    char name[64];
+    snprintf(name, sizeof(name), SHARED_REGS_NAME, device_id);
+    
+    int fd = shm_open(name, O_RDWR, 0);
+    if (fd == -1) {
+        return NULL;
+    }
+    
+    struct stat st;
+    void *mem = MAP_FAILED;
+    if (fstat(fd, &st) == 0 && (size_t)st.st_size >= sizeof(shared_regs_header_t)) {
+        mem = mmap(NULL, st.st_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    }
+    close(fd);
+    if (mem == MAP_FAILED) {
+        return NULL;
+    }
     
-    /* Try to connect to Python model via socket */
-    int model_socket = socket(AF_UNIX, SOCK_STREAM, 0);
+    volatile shared_regs_header_t *header = mem;
+    if (!header->live ||
+        sizeof(shared_regs_header_t) + (size_t)header->count * sizeof(uint32_t) > (size_t)st.st_size) {
+        munmap(mem, st.st_size);
+        return NULL;
+    }
+    
+    *size = st.st_size;
+    printf("Mapped shared registers for device %d (%u registers at 0x%x)\n",
+           device_id, header->count, header->base);
+    return header;
+}
+
+/* Return the shared register backing an aligned 32-bit access, or NULL to
+ * go through the socket. Mappings are revalidated once per model connection. */
+static volatile uint32_t *find_shared_register(uint32_t device_id, uint32_t address, uint32_t length) {
+    /* A segment only proves a model once existed; a crashed model leaves it
+     * marked live, so trust it only while connected to a running model */
     if (model_socket == -1) {
+        return NULL;
+    }
+    
+    int slot = -1;
+    for (int i = 0; i < shared_regs_count; i++) {
+        if (shared_regs[i].device_id == device_id) {
+            slot = i;
+            break;
+        }
+    }
+    if (slot == -1) {
+        if (shared_regs_count >= MAX_DEVICES) {
+            return NULL;
+        }
+        slot = shared_regs_count++;
+        shared_regs[slot].device_id = device_id;
+        shared_regs[slot].generation = 0;
+        shared_regs[slot].header = NULL;
+    }
+    
+    if (shared_regs[slot].header &&
+        (!shared_regs[slot].header->live || shared_regs[slot].generation != model_generation)) {
+        /* Model stopped, or the driver reconnected to a model that may have
+         * replaced the segment; drop the mapping and revalidate below */
+        munmap((void *)shared_regs[slot].header, shared_regs[slot].size);
+        shared_regs[slot].header = NULL;
+    }
+    if (!shared_regs[slot].header && shared_regs[slot].generation != model_generation) {
+        shared_regs[slot].generation = model_generation;
+        shared_regs[slot].header = map_shared_regs(device_id, &shared_regs[slot].size);
+    }
+    
+    volatile shared_regs_header_t *header = shared_regs[slot].header;
+    if (!header || length != sizeof(uint32_t) || address < header->base || (address & 3)) {
+        return NULL;
+    }
+    uint32_t index = (address - header->base) >> 2;
+    if (index >= header->count) {
+        return NULL;
+    }
+    return (volatile uint32_t *)(header + 1) + index;
+}
+
+/* Open a new connection to the Python model, or return -1 if it is not available */
+static int connect_to_model(void) {
+    /* SOCK_SEQPACKET keeps each protocol_message_t a single atomic message */
+    int fd = socket(AF_UNIX, SOCK_SEQPACKET, 0);
+    if (fd == -1) {
         printf("Failed to create socket for model communication\n");
         return -1;
     }
@@ -851,47 +976,117 @@ int send_message_to_model(const protocol_message_t *message, protocol_message_t
     struct sockaddr_un model_addr;
     memset(&model_addr, 0, sizeof(model_addr));
     model_addr.sun_family = AF_UNIX;
-    strncpy(model_addr.sun_path, SOCKET_PATH, sizeof(model_addr.sun_path) - 1);
+    /* memcpy rather than strncpy: an abstract name starts with a NUL byte */
+    memcpy(model_addr.sun_path, SOCKET_PATH, sizeof(SOCKET_PATH) - 1);
+    socklen_t model_addr_len = offsetof(struct sockaddr_un, sun_path) + sizeof(SOCKET_PATH) - 1;
     
     /* Attempt to connect to model - Unix sockets usually connect immediately */
-    int connect_result = connect(model_socket, (struct sockaddr*)&model_addr, sizeof(model_addr));
-    if (connect_result == -1) {
-        /* Model not available, fall back to simulation */
+    if (connect(fd, (struct sockaddr*)&model_addr, model_addr_len) == -1) {
         printf("Model not available (connect failed: %s), using simulation\n", strerror(errno));
-        close(model_socket);
-        goto simulation_fallback;
+        close(fd);
+        return -1;
     }
-    
-    printf("Connected to model successfully\n");
-    
-    /* Send message to model */
-    ssize_t bytes_sent = send(model_socket, message, sizeof(protocol_message_t), 0);
-    if (bytes_sent != sizeof(protocol_message_t)) {
-        printf("Failed to send complete message to model (%zd/%zu bytes), using simulation\n", 
-               bytes_sent, sizeof(protocol_message_t));
-        if (bytes_sent == -1) {
-            printf("send() error: %s\n", strerror(errno));
+    return fd;
+}
+
+/* Send one request to the model and receive its reply; SIGUSR1 must be blocked */
+static int exchange_with_model(const protocol_message_t *message, protocol_message_t *response) {
+    /* Registers the model shares through memory need no message at all */
+    if (message->command == CMD_READ || message->command == CMD_WRITE) {
+        volatile uint32_t *reg = find_shared_register(message->device_id, message->address, message->length);
+        if (reg) {
+            if (response) {
+                memcpy(response, message, sizeof(protocol_message_t));
+                response->result = RESULT_SUCCESS;
+                memset(response->data, 0, sizeof(response->data));
+            }
+            if (message->command == CMD_READ) {
+                uint32_t value = *reg;
+                if (response) {
+                    memcpy(response->data, &value, sizeof(value));
+                }
+            } else {
+                uint32_t value;
+                memcpy(&value, message->data, sizeof(value));
+                *reg = value;
+            }
+            return 0;
         }
-        close(model_socket);
-        goto simulation_fallback;
     }
     
-    printf("Message sent to model (%zd bytes)\n", bytes_sent);
+    printf("Sending to model: device_id=%d, cmd=%d, addr=0x%x, len=%d\n",
+           message->device_id, message->command, message->address, message->length);
     
-    /* Receive response from model */
-    if (response) {
-        ssize_t bytes_received = recv(model_socket, response, sizeof(protocol_message_t), 0);
+    /* Reuse the persistent connection to the Python model; if a reused
+     * connection turns out to be stale (model restarted), reconnect once */
+    for (int attempt = 0; attempt < 2; attempt++) {
+        int reused = (model_socket != -1);
+        if (!reused) {
+            model_socket = connect_to_model();
+            if (model_socket == -1) {
+                goto simulation_fallback;
+            }
+            model_generation++;
+            printf("Connected to model successfully\n");
+        }
+        
+        /* Send message to model */
+        ssize_t bytes_sent;
+        do {
+            bytes_sent = send(model_socket, message, sizeof(protocol_message_t), MSG_NOSIGNAL);
+        } while (bytes_sent == -1 && errno == EINTR);
+        if (bytes_sent != sizeof(protocol_message_t)) {
+            printf("Failed to send complete message to model (%zd/%zu bytes)\n", 
+                   bytes_sent, sizeof(protocol_message_t));
+            if (bytes_sent == -1) {
+                printf("send() error: %s\n", strerror(errno));
+            }
+            close(model_socket);
+            model_socket = -1;
+            if (reused) {
+                continue;
+            }
+            break;
+        }
+        
+        printf("Message sent to model (%zd bytes)\n", bytes_sent);
+        
+        /* Receive response from model; the model always replies, so the
+         * reply is drained even when the caller does not want it, or it
+         * would be read as the response to the next request */
+        protocol_message_t discarded;
+        protocol_message_t *reply = response ? response : &discarded;
+        ssize_t bytes_received;
+        do {
+            bytes_received = recv(model_socket, reply, sizeof(protocol_message_t), 0);
+        } while (bytes_received == -1 && errno == EINTR);
         if (bytes_received != sizeof(protocol_message_t)) {
-            printf("Failed to receive complete response from model (%zd/%zu bytes), using simulation\n", 
+            printf("Failed to receive complete response from model (%zd/%zu bytes)\n", 
                    bytes_received, sizeof(protocol_message_t));
             close(model_socket);
-            goto simulation_fallback;
+            model_socket = -1;
+            if (reused && bytes_received == 0) {
+                continue;
+            }
+            break;
         }
-        printf("Received response from model: result=%d (%zd bytes)\n", response->result, bytes_received);
+        if (reply->command != message->command || reply->address != message->address) {
+            /* Out of step with the model; never hand back another request's reply */
+            printf("Mismatched response from model (cmd=%d, addr=0x%x)\n",
+                   reply->command, reply->address);
+            close(model_socket);
+            model_socket = -1;
+            if (reused) {
+                continue;
+            }
+            break;
+        }
+        printf("Received response from model: result=%d (%zd bytes)\n", reply->result, bytes_received);
+        
+        return 0;
     }
     
-    close(model_socket);
-    return 0;
+    printf("Model communication failed, using simulation\n");
 
 simulation_fallback:
     /* Fallback simulation logic */
@@ -910,6 +1105,19 @@ simulation_fallback:
     return 0;
 }
 
+int send_message_to_model(const protocol_message_t *message, protocol_message_t *response) {
+    /* The driver's ISR runs in the SIGUSR1 handler and makes register
+     * accesses of its own. Hold it off until this request has its reply,
+     * so the two never interleave on the shared model connection */
+    sigset_t usr1, saved;
+    sigemptyset(&usr1);
+    sigaddset(&usr1, SIGUSR1);
+    sigprocmask(SIG_BLOCK, &usr1, &saved);
+    int result = exchange_with_model(message, response);
+    sigprocmask(SIG_SETMASK, &saved, NULL);
+    return result;
+}
+
 /* Function to get the current process PID for signal-based interrupts */
 pid_t get_interface_process_pid(void) {
     return getpid();
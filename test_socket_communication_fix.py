@@ -4,6 +4,7 @@ Comprehensive test of the fixed socket communication between C driver and Python
 This test demonstrates that the socket communication issue has been resolved.
 """
 
+import ctypes
 import subprocess
 import threading
 import time
@@ -14,13 +15,46 @@ import os
 sys.path.append('src/device_models')
 from model_interface import ModelInterface
 
+SIMULATOR_LIB = './bin/libicd3_simulator.so'
+C_APP_TIMEOUT = 30  # Seconds before the C application is considered hung
+
+def run_c_application_in_process():
+    """Run the C application inside this process via its shared library
+    
+    Only used when ICD3_IN_PROCESS=1. interface_layer_init() installs the
+    driver's SIGSEGV/SIGUSR1 handlers in this process for good and writes
+    this process's PID to /tmp/icd3_driver_pid, so model interrupts signal
+    the test process itself. The run happens on a worker thread so a hung
+    driver fails the test after C_APP_TIMEOUT instead of blocking forever.
+    """
+    print("Starting C application in-process...")
+    lib = ctypes.CDLL(os.path.abspath(SIMULATOR_LIB))
+    lib.icd3_simulator_run.restype = ctypes.c_int
+    
+    print("C Application Output:")
+    print("=" * 50, flush=True)
+    # ctypes releases the GIL, so the model thread keeps serving requests
+    result = []
+    worker = threading.Thread(target=lambda: result.append(lib.icd3_simulator_run()), daemon=True)
+    worker.start()
+    worker.join(C_APP_TIMEOUT)
+    if worker.is_alive():
+        raise subprocess.TimeoutExpired('icd3_simulator_run', C_APP_TIMEOUT)
+    returncode = result[0]
+    print("=" * 50)
+    print(f"C Application Exit Code: {returncode}")
+    return returncode == 0 or returncode == 1  # 1 is acceptable (test failure but communication works)
+
 def run_c_application():
     """Run the C application and capture its output"""
+    if os.getenv('ICD3_IN_PROCESS') == '1':
+        return run_c_application_in_process()
+    
     print("Starting C application...")
     result = subprocess.run(['./bin/icd3_simulator'], 
                           capture_output=True, 
                           text=True, 
-                          timeout=30)
+                          timeout=C_APP_TIMEOUT)
     
     print("C Application Output:")
     print("=" * 50)
@@ -63,7 +97,7 @@ def main():
             print("  • Messages are sent and received correctly")
             print("  • Register read/write operations work through socket")
             print("  • Protocol message parsing is correct")
-            print("  • Multiple sequential connections work properly")
+            print("  • Multiple messages over one persistent connection work properly")
             return True
         else:
             print("❌ FAILED: Issues detected in communication")
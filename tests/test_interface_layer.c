@@ -2,7 +2,11 @@
 #include <stdlib.h>
 #include <string.h>
 #include <unistd.h>
+#include <errno.h>
 #include <sys/wait.h>
+#include <signal.h>
+#include <fcntl.h>
+#include <sys/mman.h>
 #include "interface_layer.h"
 
 /* Simple test framework */
@@ -25,6 +29,101 @@ static int tests_passed = 0;
 
 #define RUN_TEST(name) run_test_##name()
 
+/* waitpid() that is not cut short by interrupt signals from the model */
+static void wait_for_child(pid_t pid, int *status) {
+    while (waitpid(pid, status, 0) == -1 && errno == EINTR) {
+    }
+}
+
+#define TEST_MODEL_SCRIPT "/tmp/icd3_test_model.py"
+#define TEST_MODEL_READY "/tmp/icd3_test_model_ready"
+
+/* Start ModelInterface(1, <options>) in a Python child process, running
+ * <setup> before it starts serving. Returns the child's PID once the model
+ * is listening, or -1. SIGTERM stops the model cleanly, SIGKILL simulates
+ * a crash (see stop_test_model). */
+static pid_t start_test_model(const char *options, const char *setup) {
+    char cwd[1024];
+    if (!getcwd(cwd, sizeof(cwd))) {
+        return -1;
+    }
+    
+    FILE *script = fopen(TEST_MODEL_SCRIPT, "w");
+    if (!script) {
+        printf("  Failed to create test model script\n");
+        return -1;
+    }
+    fprintf(script, "import signal, sys, threading, time\n");
+    fprintf(script, "sys.path.insert(0, '%s/src/device_models')\n", cwd);
+    fprintf(script, "from model_interface import ModelInterface\n");
+    fprintf(script, "model = ModelInterface(1%s%s)\n", *options ? ", " : "", options);
+    fprintf(script, "%s\n", setup);
+    fprintf(script, "signal.signal(signal.SIGTERM, lambda *args: model.stop())\n");
+    fprintf(script, "def announce():\n");
+    fprintf(script, "    while model._selector is None:\n");
+    fprintf(script, "        time.sleep(0.01)\n");
+    fprintf(script, "    open('%s', 'w').close()\n", TEST_MODEL_READY);
+    fprintf(script, "threading.Thread(target=announce, daemon=True).start()\n");
+    fprintf(script, "model.start()\n");
+    fclose(script);
+    
+    unlink(TEST_MODEL_READY);
+    pid_t pid = fork();
+    if (pid == 0) {
+        execl("/usr/bin/python3", "python3", TEST_MODEL_SCRIPT, NULL);
+        _exit(1);  /* If execl fails */
+    } else if (pid < 0) {
+        printf("  Failed to fork Python model process\n");
+        return -1;
+    }
+    
+    /* Wait up to 5 seconds for the model to listen */
+    for (int i = 0; i < 500; i++) {
+        if (access(TEST_MODEL_READY, F_OK) == 0) {
+            unlink(TEST_MODEL_READY);
+            return pid;
+        }
+        if (waitpid(pid, NULL, WNOHANG) == pid) {
+            printf("  Python model exited before it was ready\n");
+            return -1;
+        }
+        usleep(10000);
+    }
+    printf("  Python model did not start\n");
+    kill(pid, SIGKILL);
+    wait_for_child(pid, NULL);
+    return -1;
+}
+
+static void stop_test_model(pid_t pid, int sig) {
+    kill(pid, sig);
+    wait_for_child(pid, NULL);
+    unlink(TEST_MODEL_SCRIPT);
+}
+
+/* Shared register segment of device 1: live, base, count, reserved, then
+ * 4096 registers (see SHARED_REGS_NAME in model_interface.py) */
+#define TEST_SHARED_REGS "/icd3_regs_1"
+#define TEST_SHARED_WORDS (4 + 4096)
+
+static volatile uint32_t *map_test_shared_regs(void) {
+    int fd = shm_open(TEST_SHARED_REGS, O_RDWR, 0);
+    if (fd == -1) {
+        printf("  Failed to open %s\n", TEST_SHARED_REGS);
+        return NULL;
+    }
+    void *mem = mmap(NULL, TEST_SHARED_WORDS * sizeof(uint32_t), PROT_READ | PROT_WRITE,
+                     MAP_SHARED, fd, 0);
+    close(fd);
+    return mem == MAP_FAILED ? NULL : mem;
+}
+
+static void unmap_test_shared_regs(volatile uint32_t *words) {
+    if (words) {
+        munmap((void *)words, TEST_SHARED_WORDS * sizeof(uint32_t));
+    }
+}
+
 TEST(interface_layer_init_deinit) {
     if (interface_layer_init() != 0) {
         return -1;
@@ -106,18 +205,21 @@ TEST(protocol_message) {
 }
 
 TEST(model_to_driver_interrupt_flow) {
-    static int driver_interrupt_received = 0;
-    static uint32_t received_device_id = 0;
-    static uint32_t received_interrupt_id = 0;
+    static int handler_calls[16] = {0};
+    static int total_handler_calls = 0;
     
     /* Interrupt handler for this test */
     void test_driver_interrupt_handler(uint32_t interrupt_id) {
-        driver_interrupt_received = 1;
-        received_interrupt_id = interrupt_id;
+        if (interrupt_id < 16) {
+            handler_calls[interrupt_id]++;
+        }
+        total_handler_calls++;
         printf("  Driver interrupt handler called: irq=0x%x\n", interrupt_id);
     }
     
     printf("  Testing end-to-end interrupt flow: Python model -> C interface -> C driver...\n");
+    memset(handler_calls, 0, sizeof(handler_calls));
+    total_handler_calls = 0;
     
     if (interface_layer_init() != 0) {
         printf("  Failed to initialize interface layer\n");
@@ -131,8 +233,10 @@ TEST(model_to_driver_interrupt_flow) {
         return -1;
     }
     
-    /* Register our test interrupt handler */
-    if (register_interrupt_handler(10, test_driver_interrupt_handler) != 0) {
+    /* Register our test interrupt handler for IRQs 10-12 */
+    if (register_interrupt_handler(10, test_driver_interrupt_handler) != 0 ||
+        register_interrupt_handler(11, test_driver_interrupt_handler) != 0 ||
+        register_interrupt_handler(12, test_driver_interrupt_handler) != 0) {
         printf("  Failed to register interrupt handler\n");
         unregister_device(1);
         interface_layer_deinit();
@@ -178,9 +282,11 @@ TEST(model_to_driver_interrupt_flow) {
     fprintf(script, "# Wait a bit longer for any connections\n");
     fprintf(script, "time.sleep(3)\n");
     fprintf(script, "\n");
-    fprintf(script, "print(f'Model has {len(model.client_sockets)} connected clients')\n");
-    fprintf(script, "print('Triggering test interrupt...')\n");
-    fprintf(script, "model.trigger_interrupt_to_driver(10)\n");
+    fprintf(script, "print(f'Model has {len(model.clients)} connected clients')\n");
+    fprintf(script, "print('Triggering test interrupt burst...')\n");
+    fprintf(script, "# 13 has no handler and 99 is out of range: both must be ignored\n");
+    fprintf(script, "for irq in (10, 11, 12, 13, 99):\n");
+    fprintf(script, "    model.trigger_interrupt_to_driver(irq)\n");
     fprintf(script, "time.sleep(2)\n");
     fprintf(script, "\n");
     fprintf(script, "print('Stopping model...')\n");
@@ -233,31 +339,31 @@ TEST(model_to_driver_interrupt_flow) {
 
     /* Wait for Python process to complete */
     int status;
-    waitpid(model_pid, &status, 0);
+    wait_for_child(model_pid, &status);
     
     /* Clean up temporary script */
     unlink("/tmp/test_interrupt_model.py");
     
-    /* Verify interrupt was received by driver */
-    if (!driver_interrupt_received) {
-        printf("  ERROR: Driver interrupt handler was not called\n");
-        unregister_device(1);
-        interface_layer_deinit();
-        return -1;
+    /* Verify every handled interrupt of the burst ran its handler once */
+    for (uint32_t irq = 10; irq <= 12; irq++) {
+        if (handler_calls[irq] != 1) {
+            printf("  ERROR: Handler for irq %u called %d time(s), expected 1\n", irq, handler_calls[irq]);
+            unregister_device(1);
+            interface_layer_deinit();
+            return -1;
+        }
     }
     
-    /* Verify interrupt details */
-    if (received_interrupt_id != 10) {
-        printf("  ERROR: Wrong interrupt ID received: expected=10, actual=%d\n", received_interrupt_id);
+    /* Verify the unhandled and out-of-range interrupts were ignored */
+    if (total_handler_calls != 3) {
+        printf("  ERROR: %d handler calls, expected 3\n", total_handler_calls);
         unregister_device(1);
         interface_layer_deinit();
         return -1;
     }
     
     printf("  SUCCESS: Interrupt flow demonstrated - Python model triggers -> interface forwards -> driver handles\n");
-    printf("  Received interrupt: device=%d, irq=0x%x\n", received_device_id, received_interrupt_id);
-    printf("  NOTE: This test validates the driver interrupt handling. Full socket integration\n");
-    printf("        requires bidirectional persistent connections which are implemented in the codebase.\n");
+    printf("  Burst of 5 interrupts: handlers for irq 0xa-0xc called once each, 0xd and 0x63 ignored\n");
     
     /* Cleanup */
     unregister_device(1);
@@ -873,6 +979,275 @@ TEST(memset_rep_stos_support) {
     return 0;
 }
 
+TEST(interrupt_during_model_request) {
+    static volatile uint32_t isr_value = 0;
+    
+    /* ISR that reads a device register, like a real driver would */
+    void test_isr(uint32_t interrupt_id) {
+        (void)interrupt_id;
+        isr_value = read_register(0x40000014, 4);
+    }
+    
+    if (interface_layer_init() != 0) {
+        return -1;
+    }
+    if (register_device(1, 0x40000000, 0x1000) != 0 ||
+        register_interrupt_handler(10, test_isr) != 0) {
+        interface_layer_deinit();
+        return -1;
+    }
+    
+    /* The model raises an interrupt while the driver is blocked waiting for
+     * the first read's response */
+    pid_t model_pid = start_test_model("",
+        "model.process_command(1, 2, 0x40000010, 4, (0x1111).to_bytes(4, 'little'))\n"
+        "model.process_command(1, 2, 0x40000014, 4, (0x8888).to_bytes(4, 'little'))\n"
+        "read = model._dispatch[1]\n"
+        "fired = []\n"
+        "def read_after_interrupt(device_id, address, data):\n"
+        "    if not fired:\n"
+        "        fired.append(address)\n"
+        "        model.trigger_interrupt_to_driver(10)\n"
+        "        model.flush_interrupts()\n"
+        "        time.sleep(0.2)  # Let the signal land while the driver waits\n"
+        "    return read(device_id, address, data)\n"
+        "model._dispatch[1] = read_after_interrupt");
+    if (model_pid < 0) {
+        unregister_device(1);
+        interface_layer_deinit();
+        return -1;
+    }
+    
+    uint32_t value = read_register(0x40000010, 4);
+    printf("  Outer read: 0x%x, ISR read: 0x%x\n", value, isr_value);
+    
+    stop_test_model(model_pid, SIGTERM);
+    unregister_device(1);
+    interface_layer_deinit();
+    
+    if (value != 0x1111 || isr_value != 0x8888) {
+        printf("  ERROR: Expected outer=0x1111, ISR=0x8888\n");
+        return -1;
+    }
+    return 0;
+}
+
+TEST(model_restart_reconnect) {
+    if (interface_layer_init() != 0) {
+        return -1;
+    }
+    if (register_device(1, 0x40000000, 0x1000) != 0) {
+        interface_layer_deinit();
+        return -1;
+    }
+    
+    pid_t model_pid = start_test_model("",
+        "model.process_command(1, 2, 0x40000020, 4, (0xA0A0).to_bytes(4, 'little'))");
+    if (model_pid < 0) {
+        unregister_device(1);
+        interface_layer_deinit();
+        return -1;
+    }
+    uint32_t first = read_register(0x40000020, 4);
+    stop_test_model(model_pid, SIGTERM);
+    
+    /* The driver still holds the first model's (now closed) connection */
+    model_pid = start_test_model("",
+        "model.process_command(1, 2, 0x40000020, 4, (0xB0B0).to_bytes(4, 'little'))");
+    if (model_pid < 0) {
+        unregister_device(1);
+        interface_layer_deinit();
+        return -1;
+    }
+    uint32_t second = read_register(0x40000020, 4);
+    stop_test_model(model_pid, SIGTERM);
+    
+    printf("  Before restart: 0x%x, after restart: 0x%x\n", first, second);
+    unregister_device(1);
+    interface_layer_deinit();
+    
+    if (first != 0xA0A0 || second != 0xB0B0) {
+        printf("  ERROR: Expected 0xa0a0 then 0xb0b0\n");
+        return -1;
+    }
+    return 0;
+}
+
+TEST(shared_register_window) {
+    if (interface_layer_init() != 0) {
+        return -1;
+    }
+    if (register_device(1, 0x40000000, 0x1000) != 0) {
+        interface_layer_deinit();
+        return -1;
+    }
+    
+    pid_t model_pid = start_test_model("shared_registers=True", "");
+    volatile uint32_t *words = model_pid < 0 ? NULL : map_test_shared_regs();
+    int ret = -1;
+    if (words) {
+        /* Both directions go through the segment the model publishes */
+        write_register(0x40000010, 0x1234, 4);
+        words[4 + 5] = 0x5678;
+        uint32_t value = read_register(0x40000014, 4);
+        printf("  Segment after write: 0x%x, read of segment value: 0x%x\n", words[4 + 4], value);
+        if (words[0] == 1 && words[4 + 4] == 0x1234 && value == 0x5678) {
+            ret = 0;
+        }
+    }
+    
+    unmap_test_shared_regs(words);
+    if (model_pid > 0) {
+        stop_test_model(model_pid, SIGTERM);
+    }
+    unregister_device(1);
+    interface_layer_deinit();
+    return ret;
+}
+
+TEST(shared_register_fallback) {
+    if (interface_layer_init() != 0) {
+        return -1;
+    }
+    if (register_device(1, 0x40000000, 0x1000) != 0) {
+        interface_layer_deinit();
+        return -1;
+    }
+    
+    /* SIGUSR2 makes the model unpublish its registers but keep serving */
+    pid_t model_pid = start_test_model("shared_registers=True",
+        "signal.signal(signal.SIGUSR2, lambda *args: model._close_shared_registers())");
+    volatile uint32_t *words = model_pid < 0 ? NULL : map_test_shared_regs();
+    int ret = -1;
+    if (words) {
+        write_register(0x40000010, 0x1234, 4);
+        kill(model_pid, SIGUSR2);
+        for (int i = 0; i < 200 && words[0]; i++) {
+            usleep(10000);
+        }
+        
+        /* The driver must notice the cleared live flag and ask the model,
+         * which kept the value in private memory, not the orphaned segment */
+        words[4 + 4] = 0xAAAA;
+        uint32_t value = read_register(0x40000010, 4);
+        printf("  Live flag: %u, read after unpublish: 0x%x\n", words[0], value);
+        if (words[0] == 0 && value == 0x1234) {
+            ret = 0;
+        }
+    }
+    
+    unmap_test_shared_regs(words);
+    if (model_pid > 0) {
+        stop_test_model(model_pid, SIGTERM);
+    }
+    unregister_device(1);
+    interface_layer_deinit();
+    return ret;
+}
+
+TEST(shared_register_remap) {
+    if (interface_layer_init() != 0) {
+        return -1;
+    }
+    if (register_device(1, 0x40000000, 0x1000) != 0) {
+        interface_layer_deinit();
+        return -1;
+    }
+    
+    int ret = -1;
+    volatile uint32_t *old_words = NULL;
+    volatile uint32_t *new_words = NULL;
+    pid_t model_pid = start_test_model("shared_registers=True", "");
+    if (model_pid < 0) {
+        goto out;
+    }
+    write_register(0x40000010, 0x1111, 4);
+    old_words = map_test_shared_regs();
+    
+    /* Crash the model: its segment stays behind with the live flag set
+     * until the next model retires it */
+    stop_test_model(model_pid, SIGKILL);
+    model_pid = start_test_model("shared_registers=True", "");
+    if (model_pid < 0 || !old_words) {
+        goto out;
+    }
+    
+    write_register(0x40000010, 0x2222, 4);  /* Via the socket, then remapped */
+    write_register(0x40000014, 0x3333, 4);  /* Via the new segment */
+    uint32_t value = read_register(0x40000014, 4);
+    new_words = map_test_shared_regs();
+    if (!new_words) {
+        goto out;
+    }
+    printf("  Old segment: live=%u reg=0x%x, new segment: 0x%x 0x%x, read: 0x%x\n",
+           old_words[0], old_words[4 + 4], new_words[4 + 4], new_words[4 + 5], value);
+    if (old_words[0] == 0 && old_words[4 + 4] == 0x1111 && old_words[4 + 5] != 0x3333 &&
+        new_words[4 + 4] == 0x2222 && new_words[4 + 5] == 0x3333 && value == 0x3333) {
+        ret = 0;
+    }
+    
+out:
+    unmap_test_shared_regs(old_words);
+    unmap_test_shared_regs(new_words);
+    if (model_pid > 0) {
+        stop_test_model(model_pid, SIGTERM);
+    }
+    unregister_device(1);
+    interface_layer_deinit();
+    return ret;
+}
+
+TEST(shared_register_orphaned) {
+    if (interface_layer_init() != 0) {
+        return -1;
+    }
+    if (register_device(1, 0x40000000, 0x1000) != 0) {
+        interface_layer_deinit();
+        return -1;
+    }
+    
+    int ret = -1;
+    volatile uint32_t *words = NULL;
+    pid_t model_pid = start_test_model("shared_registers=True", "");
+    if (model_pid < 0) {
+        goto out;
+    }
+    write_register(0x40000010, 0x1111, 4);
+    
+    /* Crash the model and start a fresh driver with no model running; the
+     * segment is left behind still marked live */
+    stop_test_model(model_pid, SIGKILL);
+    model_pid = -1;
+    unregister_device(1);
+    interface_layer_deinit();
+    if (interface_layer_init() != 0 || register_device(1, 0x40000000, 0x1000) != 0) {
+        goto out;
+    }
+    words = map_test_shared_regs();
+    if (!words) {
+        goto out;
+    }
+    words[4 + 4] = 0x5555;
+    
+    uint32_t value = read_register(0x40000010, 4);
+    write_register(0x40000014, 0x3333, 4);
+    printf("  Orphaned segment: live=%u reg=0x%x 0x%x, read: 0x%x\n",
+           words[0], words[4 + 4], words[4 + 5], value);
+    if (words[0] == 1 && value == 0xDEADBEEF && words[4 + 5] != 0x3333) {
+        ret = 0;
+    }
+    
+out:
+    unmap_test_shared_regs(words);
+    shm_unlink(TEST_SHARED_REGS);
+    if (model_pid > 0) {
+        stop_test_model(model_pid, SIGTERM);
+    }
+    unregister_device(1);
+    interface_layer_deinit();
+    return ret;
+}
+
 int main(void) {
     printf("NewICD3 Interface Layer Unit Tests\n");
     printf("==================================\n\n");
@@ -892,6 +1267,22 @@ int main(void) {
     RUN_TEST(memset_rep_stos_support);
     RUN_TEST(model_to_driver_interrupt_flow);
     RUN_TEST(protocol_message);
+    RUN_TEST(interrupt_during_model_request);
+    RUN_TEST(model_restart_reconnect);
+    RUN_TEST(shared_register_window);
+    RUN_TEST(shared_register_fallback);
+    RUN_TEST(shared_register_remap);
+    RUN_TEST(shared_register_orphaned);
+    
+    /* Once bin/libmodel_core.so is built the models above answer in-window
+     * accesses natively; run the model-backed tests again on the Python path */
+    printf("\nRepeating model tests without the native model core\n");
+    setenv("ICD3_MODEL_CORE", "/nonexistent/libmodel_core.so", 1);
+    RUN_TEST(model_to_driver_interrupt_flow);
+    RUN_TEST(interrupt_during_model_request);
+    RUN_TEST(model_restart_reconnect);
+    RUN_TEST(shared_register_fallback);
+    unsetenv("ICD3_MODEL_CORE");
     
     printf("\nTest Results:\n");
     printf("Tests run: %d\n", tests_run);